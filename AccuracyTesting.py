@@ -0,0 +1,156 @@
+"""
+AccuracyTesting.py
+
+This module contains the comparison logic from the 3_AccuracyTesting notebook
+in a form that can be run headless. It loads the events extracted by the LLM,
+normalizes them, loads the human-made concert database and scores every human
+row against the LLM events of the same date.
+
+Functions:
+- normalize_text(text): Lowercases and collapses whitespace, mapping "unknown" to "".
+- load_llm_events(conn, config): Reads and normalizes the events (or events_consolidated) table.
+- load_human_data(config): Reads and normalizes the human-made Excel dataset.
+- score_human_against_llm(human_data, llm_data, columns_to_compare): Fuzzy-matches human rows against LLM rows per date.
+- save_evaluation_results(conn, results): Writes the scored rows to the evaluation_results table.
+
+Dependencies:
+- pandas
+- fuzzywuzzy
+"""
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+
+# Normalize text in all columns
+def normalize_text(text):
+    if pd.isna(text) or str(text).strip().lower() == "unknown":
+        return ""
+    return ' '.join(str(text).lower().split())
+
+
+# Function to convert date objects in the human data
+def convert_human_dates(date_obj):
+    if isinstance(date_obj, str):
+        try:
+            date = datetime.strptime(date_obj, "%Y-%m-%d")
+        except ValueError:
+            return None
+    elif isinstance(date_obj, pd.Timestamp):
+        date = date_obj.to_pydatetime()
+    else:
+        return None
+    return date.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def load_llm_events(conn, config):
+    """
+    Read the events table and normalize it the same way the notebook does.
+
+    Events sharing a date and name are discarded (both copies), as in step 1
+    of the notebook. With config['evaluate_consolidated'], the canonical
+    events in events_consolidated (see EventConsolidation.py) are read
+    instead and nothing is discarded; their event_id takes the place of
+    custom_id.
+
+    Returns:
+    DataFrame: custom_id, normalized_date and the configured comparison columns.
+    """
+    if config.get('evaluate_consolidated', False):
+        llm_data = pd.read_sql_query("SELECT CAST(event_id AS TEXT) AS custom_id, * FROM events_consolidated", conn)
+    else:
+        llm_data = pd.read_sql_query("SELECT * FROM events", conn)
+
+    llm_data['normalized_date'] = pd.to_datetime(llm_data['date'], errors='coerce')
+    llm_data = llm_data[llm_data['normalized_date'].notna()]
+    llm_data['normalized_name'] = llm_data['name'].str.strip().str.lower()
+
+    if not config.get('evaluate_consolidated', False):
+        duplicates = llm_data.duplicated(subset=['normalized_date', 'normalized_name'], keep=False)
+        llm_data = llm_data[~duplicates]
+
+    columns = ['custom_id'] + [col for col in config['columns_to_compare'] if col != 'normalized_date']
+    result = llm_data[columns].copy()
+    for col in columns[1:]:
+        result[col] = result[col].apply(normalize_text)
+    result['normalized_date'] = llm_data['normalized_date']
+    return result
+
+
+def load_human_data(config):
+    """
+    Read the human-made Excel dataset and normalize it to the events layout.
+
+    Column names are lowercased and renamed with config['column_mapping'], the
+    date is normalized and all text columns are passed through normalize_text.
+    """
+    human_data = pd.read_excel(config['Stockholm_Concert_Database_Path'])
+    human_data.columns = [col.lower() for col in human_data.columns]
+    human_data = human_data.rename(columns=config['column_mapping'])
+
+    human_data['normalized_date'] = human_data['date'].apply(convert_human_dates)
+    human_data = human_data.drop('date', axis=1)
+    human_data = human_data[human_data['normalized_date'].notna()]
+
+    text_columns = human_data.select_dtypes(include=['object']).columns
+    for col in text_columns:
+        if col != 'normalized_date':
+            human_data[col] = human_data[col].apply(normalize_text)
+
+    human_data['normalized_date'] = pd.to_datetime(human_data['normalized_date'], errors='coerce')
+    return human_data.dropna(subset=['normalized_date'])
+
+
+# Same row string as the notebook: every compared column, the date as str(Timestamp)
+def _row_string(row, columns):
+    return ' '.join(map(str, [row[col] for col in columns if col in row]))
+
+
+def score_human_against_llm(human_data, llm_data, columns_to_compare):
+    """
+    Compute the best fuzzy match (token_set_ratio) for every human row among
+    the LLM rows that share its normalized_date.
+
+    The compared strings are built from columns_to_compare exactly as in the
+    notebook, normalized_date included, so the scores match earlier runs.
+
+    Returns:
+    DataFrame: the human rows with match_score and best_match_custom_id added.
+    """
+    columns = list(columns_to_compare)
+
+    date_groups = {}
+    for date, group in llm_data.groupby('normalized_date'):
+        date_groups[date] = [(row['custom_id'], _row_string(row, columns)) for _, row in group.iterrows()]
+
+    scores = []
+    best_ids = []
+    for _, row in human_data.iterrows():
+        row_str = _row_string(row, columns)
+        max_score = 0
+        best_id = None
+        for custom_id, llm_str in date_groups.get(row['normalized_date'], []):
+            score = fuzz.token_set_ratio(row_str, llm_str)
+            if score > max_score:
+                max_score = score
+                best_id = custom_id
+        scores.append(max_score if max_score > 0 else np.nan)
+        best_ids.append(best_id)
+
+    results = human_data.copy()
+    results['match_score'] = scores
+    results['best_match_custom_id'] = best_ids
+    return results
+
+
+def save_evaluation_results(conn, results):
+    """Replace the evaluation_results table with the scored rows."""
+    results = results.copy()
+    results['normalized_date'] = results['normalized_date'].dt.strftime("%Y-%m-%d %H:%M:%S")
+    results.to_sql('evaluation_results', conn, if_exists='replace', index=False)
+    logging.info(f"Saved {len(results)} evaluation rows. "
+                 f"Mean match score: {results['match_score'].mean():.1f}, "
+                 f"median: {results['match_score'].median():.1f}")
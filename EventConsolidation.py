@@ -0,0 +1,270 @@
+"""
+EventConsolidation.py
+
+Consolidates near-duplicate events extracted by the LLM into canonical events.
+
+The same concert is reported dozens of times, by different newspapers and on
+different days, with OCR variants of its name. Events are blocked by venue
+and a window of days around their date, and within a block they are matched
+by the estimated Jaccard similarity of their name shingles using an LSH index
+(see NearDuplicates.py), so no pairwise loops are needed.
+
+Events are streamed in date order from a temporary table and only the events
+inside the current date window are kept in the index, so memory is bounded by
+the number of events in a window rather than the size of the events table.
+
+Output tables:
+- events_consolidated: one canonical row per cluster; each field holds the
+  most common value among the members.
+- events_consolidated_sources: provenance, linking every event (custom_id) to
+  its consolidated event_id and its similarity to the cluster it joined.
+
+Functions:
+- parse_event_date(value, source_date): Parses an LLM date into a datetime.date.
+- consolidate_events(conn, config): Rebuilds events_consolidated and events_consolidated_sources.
+
+Dependencies:
+- numpy
+"""
+import logging
+import re
+from collections import Counter, deque
+from datetime import date, datetime
+
+from NearDuplicates import estimated_jaccard, lsh_params, minhash_signature, shingles
+
+EVENT_FIELDS = ['date', 'name', 'venue', 'organizer', 'performers', 'programme']
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d.%m.%Y', '%Y.%m.%d', '%d/%m/%Y']
+BATCH_SIZE = 10000
+
+
+def _normalize(text):
+    if text is None or str(text).strip().lower() in ('', 'unknown', 'nan'):
+        return ''
+    return ' '.join(str(text).lower().split())
+
+
+def parse_event_date(value, source_date=None):
+    """
+    Parse a date as written by the LLM (ISO or "DD.MM.YY").
+
+    Two-digit years resolve to the year closest to the newspaper date
+    (YYYY.MM.DD) when known, so '02.01.00' in an 1899 paper is 1900;
+    otherwise the 1900s are assumed.
+    """
+    value = str(value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    match = re.fullmatch(r'(\d{1,2})\.(\d{1,2})\.(\d{2})', value)
+    if match:
+        day, month, short_year = (int(part) for part in match.groups())
+        year = 1900 + short_year
+        if source_date and re.match(r'\d{4}', str(source_date)):
+            source_year = int(str(source_date)[:4])
+            century = source_year // 100 * 100
+            candidates = [century - 100 + short_year, century + short_year, century + 100 + short_year]
+            year = min(candidates, key=lambda candidate: abs(candidate - source_year))
+        try:
+            return date(year, month, day)
+        except ValueError:
+            return None
+    return None
+
+
+def _create_output_tables(cursor):
+    cursor.execute('DROP TABLE IF EXISTS events_consolidated')
+    cursor.execute('DROP TABLE IF EXISTS events_consolidated_sources')
+    cursor.execute('''
+        CREATE TABLE events_consolidated (
+            event_id INTEGER PRIMARY KEY,
+            date TEXT,
+            name TEXT,
+            venue TEXT,
+            organizer TEXT,
+            performers TEXT,
+            programme TEXT,
+            source_count INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE events_consolidated_sources (
+            custom_id TEXT,
+            event_id INTEGER,
+            similarity REAL
+        )
+    ''')
+
+
+def _stage_events(conn):
+    """Copy events into a temporary table keyed by day ordinal, in chunks."""
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS temp.events_by_day')
+    cursor.execute('''
+        CREATE TEMP TABLE events_by_day (
+            day INTEGER, venue_key TEXT, custom_id TEXT,
+            date TEXT, name TEXT, venue TEXT, organizer TEXT, performers TEXT, programme TEXT
+        )
+    ''')
+    # The newspaper date resolves the century of two-digit years. It is only
+    # reachable through the keyed tables written by Pipeline.py.
+    prompt_columns = [row[1] for row in conn.execute('PRAGMA table_info(pipeline_prompts)')]
+    source = conn.cursor()
+    if 'hash' in prompt_columns:
+        source.execute('''
+            SELECT e.custom_id, e.date, e.name, e.venue, e.organizer, e.performers, e.programme, d.Date
+            FROM events e
+            LEFT JOIN pipeline_prompts p ON p.custom_id = e.custom_id
+            LEFT JOIN pipeline_blocks d ON d.hash = p.hash
+        ''')
+    else:
+        source.execute('''
+            SELECT custom_id, date, name, venue, organizer, performers, programme, NULL
+            FROM events
+        ''')
+    skipped = 0
+    while True:
+        rows = source.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        batch = []
+        for custom_id, raw_date, name, venue, organizer, performers, programme, source_date in rows:
+            event_date = parse_event_date(raw_date, source_date)
+            if event_date is None:
+                skipped += 1
+                continue
+            batch.append((event_date.toordinal(), _normalize(venue), custom_id, event_date.isoformat(),
+                          name, venue, organizer, performers, programme))
+        cursor.executemany('INSERT INTO events_by_day VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+    cursor.execute('CREATE INDEX temp.events_by_day_day ON events_by_day (day)')
+    if skipped:
+        logging.info(f"Skipped {skipped} events without a parseable date")
+    return cursor
+
+
+class _Cluster:
+    def __init__(self, event_id, day, venue_key, signature, band_keys):
+        # The first member's day and signature stand for the whole cluster
+        self.event_id = event_id
+        self.first_day = day
+        self.venue_key = venue_key
+        self.signature = signature
+        self.band_keys = band_keys
+        self.sources = []
+        self.values = {field: Counter() for field in EVENT_FIELDS}
+
+    def add(self, custom_id, similarity, values):
+        self.sources.append((custom_id, self.event_id, similarity))
+        for field, value in zip(EVENT_FIELDS, values):
+            if _normalize(value):
+                self.values[field][value] += 1
+
+    def canonical_row(self):
+        row = [self.event_id]
+        for field in EVENT_FIELDS:
+            counts = self.values[field]
+            # Most common value, ties broken by the longest (least truncated) one
+            row.append(max(counts, key=lambda value: (counts[value], len(str(value)))) if counts else None)
+        row.append(len(self.sources))
+        return tuple(row)
+
+
+def consolidate_events(conn, config):
+    """
+    Rebuild events_consolidated and events_consolidated_sources from events.
+
+    An event joins the most similar open cluster at the same venue whose first
+    event is at most event_date_window_days earlier. Events without a name
+    always form their own cluster. Measuring the window from
+    the first event keeps a concert series advertised every day from chaining
+    into a single event.
+
+    Config keys:
+    event_similarity_threshold (float): Estimated Jaccard similarity of name shingles to merge events. Default 0.6.
+    event_date_window_days (int): Events at most this many days apart can be merged. Default 1.
+    event_shingle_size (int): Length of the character shingles of names. Default 3.
+    """
+    threshold = config.get('event_similarity_threshold', 0.6)
+    window = config.get('event_date_window_days', 1)
+    shingle_size = config.get('event_shingle_size', 3)
+    num_perm = 64
+    bands, rows_per_band = lsh_params(threshold, num_perm)
+
+    cursor = _stage_events(conn)
+    writer = conn.cursor()
+    _create_output_tables(writer)
+
+    # Open clusters in creation (= first day) order, indexed per venue and LSH band
+    open_clusters = deque()
+    buckets = {}
+    pending_rows, pending_sources = [], []
+    next_event_id = 0
+    total_events = 0
+
+    def flush(force=False):
+        nonlocal pending_rows, pending_sources
+        if force or len(pending_sources) >= BATCH_SIZE:
+            writer.executemany('INSERT INTO events_consolidated VALUES (?, ?, ?, ?, ?, ?, ?, ?)', pending_rows)
+            writer.executemany('INSERT INTO events_consolidated_sources VALUES (?, ?, ?)', pending_sources)
+            pending_rows, pending_sources = [], []
+
+    def close_clusters(before_day):
+        while open_clusters and open_clusters[0].first_day < before_day:
+            cluster = open_clusters.popleft()
+            for band_key in cluster.band_keys:
+                key = (cluster.venue_key,) + band_key
+                buckets[key].discard(cluster)
+                if not buckets[key]:
+                    del buckets[key]
+            pending_rows.append(cluster.canonical_row())
+            pending_sources.extend(cluster.sources)
+        flush()
+
+    current_day = None
+    cursor.execute('''
+        SELECT day, venue_key, custom_id, date, name, venue, organizer, performers, programme
+        FROM events_by_day ORDER BY day
+    ''')
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for day, venue_key, custom_id, *values in rows:
+            if day != current_day:
+                current_day = day
+                close_clusters(day - window)
+            total_events += 1
+
+            # Events without a usable name ('', NULL, 'unknown') all share one
+            # signature, so they are never merged and stay out of the index
+            name = _normalize(values[1])
+            signature = minhash_signature(shingles(name, shingle_size), num_perm)
+            band_keys = [(band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes())
+                         for band in range(bands)] if name else []
+
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(buckets.get((venue_key,) + band_key, ()))
+            best_cluster, best_similarity = None, 0.0
+            for cluster in candidates:
+                similarity = estimated_jaccard(signature, cluster.signature)
+                if similarity >= threshold and similarity > best_similarity:
+                    best_cluster, best_similarity = cluster, similarity
+
+            if best_cluster is None:
+                best_cluster = _Cluster(next_event_id, day, venue_key, signature, band_keys)
+                best_similarity = 1.0
+                next_event_id += 1
+                open_clusters.append(best_cluster)
+                for band_key in band_keys:
+                    buckets.setdefault((venue_key,) + band_key, set()).add(best_cluster)
+            best_cluster.add(custom_id, best_similarity, values)
+
+    close_clusters(float('inf'))
+    flush(force=True)
+    writer.execute('CREATE INDEX IF NOT EXISTS events_consolidated_sources_event_id ON events_consolidated_sources (event_id)')
+    writer.execute('DROP TABLE IF EXISTS temp.events_by_day')
+    conn.commit()
+    logging.info(f"Consolidated {total_events} events into {next_event_id} canonical events")
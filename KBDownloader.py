@@ -13,15 +13,51 @@ import logging
 from contextlib import closing
 import time
 from sqlite3 import OperationalError
+import threading
+import math
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Keep track of the last request time
 last_request_time = None
 
+# Define the newspaper collection IDs
+NEWSPAPER_COLLECTION_IDS = {
+    'Dagens nyheter': 'https://libris.kb.se/m5z2w4lz3m2zxpk#it',
+    'Svenska Dagbladet': 'https://libris.kb.se/2ldhmx8d4mcrlq9#it',
+    'Aftonbladet': 'https://libris.kb.se/dwpgqn5q03ft91j#it',
+    'Dagligt Allehanda': 'https://libris.kb.se/9tmqzv3m32xfzcz#it',
+    'Nya Dagligt Allehanda': 'https://libris.kb.se/2ldqsh7d0gp04wb#it'
+}
+
+NEWSPAPER_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS newspaper_data (
+        Date TEXT,
+        [Package ID] TEXT,
+        Part INTEGER,
+        Page INTEGER,
+        [ComposedBlock ID] TEXT,
+        [ComposedBlock Content] TEXT,
+        [Raw API Result] TEXT,
+        [Full Prompt] TEXT
+    )
+'''
+
+# Function to create the newspaper_data table if it doesn't exist
+def create_newspaper_table(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(NEWSPAPER_TABLE_SQL)
+        conn.commit()
+
 def retry_on_db_lock(func, max_attempts=5, delay=1):
     def wrapper(*args, **kwargs):
         attempts = 0
+        wait_time = delay
         while attempts < max_attempts:
             try:
                 return func(*args, **kwargs)
@@ -30,9 +66,9 @@ def retry_on_db_lock(func, max_attempts=5, delay=1):
                     attempts += 1
                     if attempts == max_attempts:
                         raise
-                    logging.warning(f"Database locked. Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                    delay *= 2  # Exponential backoff
+                    logging.warning(f"Database locked. Retrying in {wait_time} seconds...")
+                    time.sleep(wait_time)
+                    wait_time *= 2  # Exponential backoff
                 else:
                     raise
     return wrapper
@@ -73,6 +109,268 @@ def retry_with_backoff(func, max_attempts=5, initial_wait=1, backoff_factor=2):
                     raise
     return wrapper
 
+# Longest pause a Retry-After header can ask for; larger values are treated as bogus
+MAX_RETRY_AFTER = 3600
+
+# Function to parse a Retry-After header (seconds or HTTP date) into seconds
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return min(max(0.0, seconds), MAX_RETRY_AFTER) if math.isfinite(seconds) else None
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return min(max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()), MAX_RETRY_AFTER)
+
+
+class RateController:
+    """
+    Adaptive (AIMD) rate limiter shared by all KB requests.
+
+    The request rate grows additively (by about `increase` requests/s per
+    second) while responses are healthy and is cut multiplicatively on 429,
+    5xx and connection errors. A Retry-After header pauses all callers until
+    the given time (at most MAX_RETRY_AFTER seconds), opening the circuit when
+    that is longer than the cooldown. After `failure_threshold` consecutive failures the circuit
+    opens and every caller waits `cooldown` seconds; the first request after
+    that is a probe, and a single further failure opens it again.
+
+    Thread safe, so fetchers running in parallel share one rate budget.
+    """
+
+    def __init__(self, initial_rate=10, min_rate=0.2, max_rate=50, increase=0.5, decrease=0.5,
+                 failure_threshold=5, cooldown=60, timeout=60):
+        self.rate = float(initial_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.consecutive_failures = 0
+        self._next_slot = time.monotonic()
+        self._open_until = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._open_until is not None and now < self._open_until:
+                    wait = self._open_until - now
+                else:
+                    wait = self._next_slot - now
+                    if wait <= 0:
+                        self._next_slot = max(self._next_slot, now) + 1 / self.rate
+                        return
+            time.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._open_until = None
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.consecutive_failures += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            if retry_after:
+                retry_after = min(retry_after, MAX_RETRY_AFTER)
+                if retry_after > self.cooldown:
+                    # Longer than a cooldown: open the circuit until the server is ready
+                    self._open_until = max(self._open_until or now, now + retry_after)
+                else:
+                    self._next_slot = max(self._next_slot, now + retry_after)
+            if self.consecutive_failures >= self.failure_threshold:
+                self._open_until = max(self._open_until or now, now + self.cooldown)
+                # Half-open after the cooldown: one more failure trips it again
+                self.consecutive_failures = self.failure_threshold - 1
+                logging.error(f"Circuit breaker open after repeated KB failures. Pausing requests for {self.cooldown} seconds.")
+            logging.warning(f"KB request rate reduced to {self.rate:.2f} requests/s")
+
+    def get(self, url, max_retries=5, backoff=1, **kwargs):
+        """
+        Rate-limited requests.get with retries on 429, 5xx and connection errors.
+
+        Returns the last response (callers still call raise_for_status), or
+        re-raises the connection error after max_retries retries. Only 2xx and
+        3xx responses count as healthy; other 4xx responses are returned
+        without changing the rate.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                response = requests.get(url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.record_failure(backoff * 2 ** attempt)
+                if attempt == max_retries:
+                    raise
+                logging.warning(f"Exception occurred while fetching {url}: {e}. Retrying...")
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                self.record_failure(retry_after if retry_after is not None else backoff * 2 ** attempt)
+                if attempt == max_retries:
+                    return response
+                logging.warning(f"Status code {response.status_code} from {url}. Retrying...")
+                continue
+
+            if response.status_code < 400:
+                self.record_success()
+            return response
+
+
+# Shared controller for all KB calls, created on first use
+_kb_rate_controller = None
+_kb_rate_controller_lock = threading.Lock()
+
+def get_rate_controller(rate_limit=None):
+    global _kb_rate_controller
+    with _kb_rate_controller_lock:
+        if _kb_rate_controller is None:
+            _kb_rate_controller = RateController(initial_rate=rate_limit or 10)
+        return _kb_rate_controller
+
+class _PhaseTiming:
+    """Mutable record yielded by CrawlStats.timed so callers can attach bytes and items."""
+    __slots__ = ('bytes', 'items')
+
+    def __init__(self, nbytes=0, items=0):
+        self.bytes = nbytes
+        self.items = items
+
+
+class CrawlStats:
+    """
+    Low-overhead timing instrumentation for one crawl work unit.
+
+    Per phase it keeps the call count, total seconds, bytes and items, and a
+    latency histogram with power-of-two millisecond buckets (bucket i counts
+    calls taking less than 2**i ms). Every `report_interval` seconds a
+    throughput line (pages/s, MB/s, rows/s) is logged. Thread safe.
+    """
+
+    PHASES = ['search', 'page_json', 'alto_download', 'parse', 'match', 'db_insert']
+    NETWORK_PHASES = ['search', 'page_json', 'alto_download']
+    # Only kept in phase_stats: time the fetcher spent blocked on a full parse queue
+    EXTRA_PHASES = ['parse_wait']
+    HISTOGRAM_BUCKETS = 20
+
+    def __init__(self, query=None, from_date=None, to_date=None, report_interval=10):
+        self.query = query
+        self.from_date = from_date
+        self.to_date = to_date
+        self.report_interval = report_interval
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._lock = threading.Lock()
+        self.phases = {phase: {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'items': 0,
+                               'histogram_ms': [0] * self.HISTOGRAM_BUCKETS}
+                       for phase in self.PHASES + self.EXTRA_PHASES}
+
+    def add(self, phase, seconds, nbytes=0, items=0):
+        bucket = min(self.HISTOGRAM_BUCKETS - 1, max(0, int(seconds * 1000)).bit_length())
+        with self._lock:
+            stats = self.phases[phase]
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += nbytes
+            stats['items'] += items
+            stats['histogram_ms'][bucket] += 1
+        self.maybe_report()
+
+    @contextmanager
+    def timed(self, phase, nbytes=0, items=0):
+        timing = _PhaseTiming(nbytes, items)
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            self.add(phase, time.perf_counter() - start, timing.bytes, timing.items)
+
+    def throughput_line(self):
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        pages = self.phases['alto_download']['items']
+        nbytes = sum(self.phases[phase]['bytes'] for phase in self.NETWORK_PHASES)
+        rows = self.phases['db_insert']['items']
+        return (f"[{self.query} {self.from_date}..{self.to_date}] {pages} pages ({pages / elapsed:.2f}/s), "
+                f"{nbytes / 1e6:.1f} MB ({nbytes / 1e6 / elapsed:.2f} MB/s), {rows} rows ({rows / elapsed:.1f}/s)")
+
+    def maybe_report(self):
+        now = time.perf_counter()
+        with self._lock:
+            if now - self._last_report < self.report_interval:
+                return
+            self._last_report = now
+        logging.info(self.throughput_line())
+
+    def summary(self):
+        with self._lock:
+            return {
+                'query': self.query,
+                'from_date': self.from_date,
+                'to_date': self.to_date,
+                'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+                'wall_seconds': time.perf_counter() - self._start,
+                'pages': self.phases['alto_download']['items'],
+                'rows_inserted': self.phases['db_insert']['items'],
+                'bytes': sum(self.phases[phase]['bytes'] for phase in self.NETWORK_PHASES),
+                'phases': json.loads(json.dumps(self.phases)),
+            }
+
+
+# Function to persist a crawl summary to the crawl_runs table
+@retry_on_db_lock
+def save_crawl_run(db_path, summary, success=True):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                id INTEGER PRIMARY KEY,
+                query TEXT,
+                from_date TEXT,
+                to_date TEXT,
+                started DATETIME,
+                success INTEGER,
+                wall_seconds REAL,
+                pages INTEGER,
+                rows_inserted INTEGER,
+                bytes INTEGER,
+                search_seconds REAL,
+                page_json_seconds REAL,
+                alto_download_seconds REAL,
+                parse_seconds REAL,
+                match_seconds REAL,
+                db_insert_seconds REAL,
+                phase_stats TEXT
+            )
+        ''')
+        phases = summary['phases']
+        conn.execute('''
+            INSERT INTO crawl_runs
+            (query, from_date, to_date, started, success, wall_seconds, pages, rows_inserted, bytes,
+             search_seconds, page_json_seconds, alto_download_seconds, parse_seconds, match_seconds,
+             db_insert_seconds, phase_stats)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (summary['query'], summary['from_date'], summary['to_date'], summary['started'], int(success),
+              summary['wall_seconds'], summary['pages'], summary['rows_inserted'], summary['bytes'],
+              *(phases[phase]['seconds'] for phase in CrawlStats.PHASES), json.dumps(phases)))
+        conn.commit()
+
 import sqlite3
 
 def insert_batch(conn, data_list):
@@ -85,7 +383,7 @@ def insert_batch(conn, data_list):
     conn.commit()
 
 # Function to search Swedish newspapers
-def search_swedish_newspapers(to_date, from_date, collection_id, query):
+def search_swedish_newspapers(to_date, from_date, collection_id, query, rate_controller=None, limit=100000):
     base_url = 'https://data.kb.se/search'
     encoded_query = quote_plus(query)
     params = {
@@ -94,10 +392,11 @@ def search_swedish_newspapers(to_date, from_date, collection_id, query):
         'isPartOf.@id': collection_id,
         'q': encoded_query,
         'searchGranularity': 'part',
-        'limit': 100000
+        'limit': limit
     }
     headers = {'Accept': 'application/json'}
-    response = requests.get(base_url, params=params, headers=headers)
+    rate_controller = rate_controller or get_rate_controller()
+    response = rate_controller.get(base_url, params=params, headers=headers)
     response.raise_for_status()
     try:
         return response.json()
@@ -156,7 +455,7 @@ def extract_xml_urls(api_response, page_ids, kb_key):
                 xml_url = f"{xml_url}?api_key={kb_key}"
 
                 xml_urls[page_number] = xml_url
-                logging.info(f"Extracted XML URL for page {page_number}")
+                logging.debug(f"Extracted XML URL for page {page_number}")
 
     if not xml_urls:
         logging.warning("No XML URLs were extracted from the API response")
@@ -164,32 +463,24 @@ def extract_xml_urls(api_response, page_ids, kb_key):
     return xml_urls
 
 # Function to fetch XML content
-def fetch_xml_content(xml_urls, max_retries=5, initial_delay=5):
+def fetch_xml_content(xml_urls, max_retries=5, initial_delay=5, rate_controller=None, stats=None):
+    rate_controller = rate_controller or get_rate_controller()
+    stats = stats or CrawlStats(report_interval=float('inf'))
     xml_content_by_page = {}
     for page_number, url in xml_urls.items():
-        retries = 0
-        delay = initial_delay
-        while retries < max_retries:
-            try:
-                response = requests.get(url)
+        try:
+            with stats.timed('alto_download') as timing:
+                response = rate_controller.get(url, max_retries=max_retries, backoff=initial_delay)
                 if response.status_code == 200:
-                    xml_content_by_page[page_number] = response.content
-                    break
-                else:
-                    print(f"Failed to fetch XML content from {url}. Status code: {response.status_code}")
-                    if response.status_code == 429:
-                        retries += 1
-                        print(f"Rate limited. Retrying in {delay} seconds...")
-                        time.sleep(delay)
-                        delay *= 2
-                    else:
-                        break
-            except requests.exceptions.RequestException as e:
-                print(f"Exception occurred while fetching {url}: {e}")
-                retries += 1
-                print(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= 2
+                    timing.bytes = len(response.content)
+                    timing.items = 1
+        except requests.exceptions.RequestException as e:
+            print(f"Exception occurred while fetching {url}: {e}")
+            continue
+        if response.status_code == 200:
+            xml_content_by_page[page_number] = response.content
+        else:
+            print(f"Failed to fetch XML content from {url}. Status code: {response.status_code}")
     return xml_content_by_page
 
 # Function to read system message from a file
@@ -229,6 +520,21 @@ def row_to_json(row, config, counter):
 def save_to_database(df, db_conn, table_name):
     df.to_sql(table_name, db_conn, if_exists='append', index=False)
 
+# Function to parse one ALTO page; runs in worker processes when a parse_executor is used
+def parse_alto_page(xml_content, query, num_blocks):
+    """
+    Parse ALTO XML bytes and extract the ComposedBlock windows matching the query.
+
+    Returns:
+    tuple: (date, list of window texts, parse seconds, match seconds)
+    """
+    start = time.perf_counter()
+    page = Page(xml_content=xml_content.decode('utf-8'))
+    parsed = time.perf_counter()
+    date = page.extract_date()
+    articles = [article for article in page.article_from_keyword(query, num_blocks=num_blocks) if article]
+    return date, articles, parsed - start, time.perf_counter() - parsed
+
 class Page:
     def __init__(self, xml_path=None, xml_content=None) -> None:
         if xml_path is not None:
@@ -467,97 +773,143 @@ from bs4 import BeautifulSoup as bs
 from urllib.parse import urljoin
 import hashlib
 
-def fetch_newspaper_data(query, from_date, to_date, newspaper, config, db_path, kb_key, rate_limit, num_composed_blocks):
+def fetch_newspaper_data(query, from_date, to_date, newspaper, config, db_path, kb_key, rate_limit, num_composed_blocks, rate_controller=None, parse_executor=None):
     logging.info(f"Starting fetch_newspaper_data for query: {query}, dates: {from_date} to {to_date}")
     
     total_rows_inserted = 0
-    RATE_LIMIT = rate_limit
-    last_request_time = None
+    # rate_limit is only the starting rate; the shared controller adapts it
+    rate_controller = rate_controller or get_rate_controller(rate_limit)
+    stats = CrawlStats(query, from_date, to_date, report_interval=config.get('crawl_report_interval', 10))
     batch = []
     batch_size = 100
 
     try:
-        search_results = search_swedish_newspapers(to_date, from_date, newspaper, query)
+        with stats.timed('search') as timing:
+            search_results = search_swedish_newspapers(to_date, from_date, newspaper, query, rate_controller=rate_controller)
+            timing.items = len(search_results.get('hits', []))
         logging.info(f"Search results received. Hits: {len(search_results.get('hits', []))}")
     except requests.HTTPError as e:
         logging.error(f"Failed to fetch search results: {e}")
+        save_crawl_run(db_path, stats.summary(), success=False)
         return {"success": False, "message": f"Failed to fetch search results: {e}", "rows_inserted": 0}
 
     urls = extract_urls(search_results)
     logging.info(f"Extracted {len(urls)} URLs from search results")
 
-    for info in urls:
-        url = info['url']
-        page_id = info['page_id']
-
-        # Rate limiting logic
-        current_time = time.time()
-        if last_request_time is not None:
-            elapsed_time = current_time - last_request_time
-            if elapsed_time < 1 / RATE_LIMIT:
-                time.sleep(1 / RATE_LIMIT - elapsed_time)
-        last_request_time = time.time()
-
-        logging.info(f"Processing URL: {url}")
-
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            api_response = response.json()
-
-            xml_urls = extract_xml_urls(api_response, [page_id], kb_key)
-            logging.info(f"Extracted {len(xml_urls)} XML URLs")
+    def flush_batch():
+        nonlocal batch, total_rows_inserted
+        with stats.timed('db_insert') as timing:
+            rows_inserted = insert_batch_with_transaction(db_path, batch)
+            timing.items = rows_inserted
+        total_rows_inserted += rows_inserted
+        batch = []
+        logging.debug(f"Inserted batch of {rows_inserted} rows. Total rows inserted: {total_rows_inserted}")
+
+    def add_parsed_page(info, page_number, raw_api_result, nbytes, parsed):
+        date, articles, parse_seconds, match_seconds = parsed
+        stats.add('parse', parse_seconds, nbytes, 1)
+        stats.add('match', match_seconds, items=len(articles))
+        if not articles:
+            logging.debug(f"No matching content found for query '{query}' on page {page_number}")
+            return
+
+        for article in articles:
+            # Generate a unique hash for the article content
+            hash_content = hashlib.md5(article.encode('utf-8')).hexdigest()
+            composed_block_id = f"{info['package_id']}-{info['part_number']}-{page_number}-{hash_content}"
+
+            batch.append((
+                date,
+                info['package_id'],
+                info['part_number'],
+                page_number,
+                composed_block_id,
+                article,
+                raw_api_result,
+                None  # Placeholder for [Full Prompt] which is no longer needed
+            ))
+
+            if len(batch) >= batch_size:
+                flush_batch()
+
+    # Parse jobs in submission order when a parse_executor is used
+    pending = deque()
+    max_pending = config.get('parse_queue_size', 32)
+
+    def drain(block):
+        while pending and (block or pending[0][0].done()):
+            future, info, page_number, raw_api_result, nbytes = pending.popleft()
+            try:
+                add_parsed_page(info, page_number, raw_api_result, nbytes, future.result())
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logging.error(f"Unexpected error parsing page {page_number} of {info['url']}: {str(e)}")
+            block = False
 
-            xml_content_by_page = fetch_xml_content(xml_urls)
-            logging.info(f"Fetched XML content for {len(xml_content_by_page)} pages")
+    try:
+        for info in urls:
+            url = info['url']
+            page_id = info['page_id']
 
-            for page_number, xml_content in xml_content_by_page.items():
-                xml_string = xml_content.decode('utf-8')
-                page = Page(xml_content=xml_string)
-                date = page.extract_date()
+            logging.debug(f"Processing URL: {url}")
 
-                articles = list(page.article_from_keyword(query, num_blocks=num_composed_blocks))
-                if not articles:
-                    logging.info(f"No matching content found for query '{query}' on page {page_number}")
-                    continue
+            try:
+                with stats.timed('page_json', items=1) as timing:
+                    response = rate_controller.get(url)
+                    response.raise_for_status()
+                    timing.bytes = len(response.content)
+                    api_response = response.json()
+                raw_api_result = json.dumps(api_response)
+
+                xml_urls = extract_xml_urls(api_response, [page_id], kb_key)
+                logging.debug(f"Extracted {len(xml_urls)} XML URLs")
+
+                xml_content_by_page = fetch_xml_content(xml_urls, rate_controller=rate_controller, stats=stats)
+                logging.debug(f"Fetched XML content for {len(xml_content_by_page)} pages")
+
+                for page_number, xml_content in xml_content_by_page.items():
+                    if parse_executor is None:
+                        add_parsed_page(info, page_number, raw_api_result, len(xml_content),
+                                        parse_alto_page(xml_content, query, num_composed_blocks))
+                        continue
+
+                    # Backpressure: wait for the oldest parse when the queue is full
+                    if len(pending) >= max_pending:
+                        with stats.timed('parse_wait'):
+                            drain(block=True)
+                    pending.append((parse_executor.submit(parse_alto_page, xml_content, query, num_composed_blocks),
+                                    info, page_number, raw_api_result, len(xml_content)))
+                    drain(block=False)
+
+                logging.debug(f"Processed URL: {url}")
+
+            except BrokenProcessPool:
+                raise
+            except requests.HTTPError as e:
+                logging.error(f"Failed to fetch data from {url}. Status code: {e.response.status_code}")
+                continue
+            except Exception as e:
+                logging.error(f"Unexpected error processing URL {url}: {str(e)}")
+                continue
 
-                for article in articles:
-                    if article:
-                        # Generate a unique hash for the article content
-                        hash_content = hashlib.md5(article.encode('utf-8')).hexdigest()
-                        composed_block_id = f"{info['package_id']}-{info['part_number']}-{page_number}-{hash_content}"
-
-                        batch.append((
-                            date,
-                            info['package_id'],
-                            info['part_number'],
-                            page_number,
-                            composed_block_id,
-                            article,
-                            json.dumps(api_response),
-                            None  # Placeholder for [Full Prompt] which is no longer needed
-                        ))
-
-                        if len(batch) >= batch_size:
-                            rows_inserted = insert_batch_with_transaction(db_path, batch)
-                            total_rows_inserted += rows_inserted
-                            batch = []
-                            logging.info(f"Inserted batch of {rows_inserted} rows. Total rows inserted: {total_rows_inserted}")
-
-            logging.info(f"Processed URL: {url}")
-
-        except requests.HTTPError as e:
-            logging.error(f"Failed to fetch data from {url}. Status code: {e.response.status_code}")
-            continue
-        except Exception as e:
-            logging.error(f"Unexpected error processing URL {url}: {str(e)}")
-            continue
+        # Collect outstanding parse jobs
+        while pending:
+            drain(block=True)
+    except BrokenProcessPool as e:
+        # A dead parse worker breaks the pool for every later page: keep what was
+        # parsed, but fail the unit so it is fetched again
+        logging.error(f"Parse worker pool is broken, aborting {query} {from_date} to {to_date}: {e}")
+        if batch:
+            flush_batch()
+        save_crawl_run(db_path, stats.summary(), success=False)
+        raise
 
     # Insert any remaining rows in the batch
     if batch:
-        rows_inserted = insert_batch_with_transaction(db_path, batch)  # Change here
-        total_rows_inserted += rows_inserted
-        logging.info(f"Inserted final batch of {rows_inserted} rows. Total rows inserted: {total_rows_inserted}")
+        flush_batch()
 
+    logging.info(stats.throughput_line())
+    save_crawl_run(db_path, stats.summary())
     logging.info(f"Data processing completed. Total rows saved: {total_rows_inserted}")
-    return {"success": True, "message": f"Data processing completed. {total_rows_inserted} rows saved to the database.", "rows_inserted": total_rows_inserted}
+    return {"success": True, "message": f"Data processing completed. {total_rows_inserted} rows saved to the database.", "rows_inserted": total_rows_inserted, "stats": stats.summary()}
@@ -24,6 +24,9 @@ Functions:
 - process_prompt(conn, row_id, prompt): Processes a single prompt, interacting with the OpenAI API and storing results.
 - fetch_prompts_from_db(conn): Fetches JSON prompts from the newspaper_data table.
 - save_results_to_db(conn, results): Saves API results to the Results table in the database.
+- build_full_prompt(custom_id, date, content, config, system_message_content, json_schema): Builds a batch-style prompt for one ComposedBlock.
+- request_completion(client, prompt): Sends a full prompt to the OpenAI API and returns the JSON content.
+- store_completion(conn, custom_id, content): Inserts or replaces a completion.
 
 Usage:
 This script is designed to be run as part of a larger digital humanities workflow.
@@ -223,6 +226,51 @@ def process_prompt(conn, client, row_id, prompt):
         logging.error(f"Error processing prompt for row_id {row_id}: {e}")
         logging.exception("Full traceback:")
 
+def build_full_prompt(custom_id, date, content, config, system_message_content, json_schema):
+    """Build the batch-style prompt JSON for one ComposedBlock (see 1_Download_from_KB)."""
+    system_message = {"role": "system", "content": system_message_content.replace('{Newspaper_Date}', str(date))}
+    user_message = {"role": "user", "content": str(content)}
+
+    full_prompt = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": config['llm_model'],
+            "messages": [system_message, user_message],
+            "max_tokens": config['max_tokens'],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "response_data",
+                    "strict": True,
+                    "schema": json_schema
+                }
+            }
+        }
+    }
+    return json.dumps(full_prompt)
+
+def request_completion(client, prompt):
+    """Send a full prompt to the OpenAI API and return the message content."""
+    body = json.loads(prompt)['body']
+    completion = client.chat.completions.create(
+        model=body['model'],
+        messages=body['messages'],
+        max_tokens=body['max_tokens'],
+        response_format=body['response_format']
+    )
+    return completion.choices[0].message.content
+
+def store_completion(conn, custom_id, content):
+    """Insert or replace the completion for custom_id."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR REPLACE INTO completions (custom_id, content)
+        VALUES (?, ?)
+    ''', (custom_id, content))
+    conn.commit()
+
 def fetch_prompts_from_db(conn):
     """Fetch JSON prompts from the newspaper_data table."""
     fetch_sql = "SELECT [Full Prompt] FROM newspaper_data"
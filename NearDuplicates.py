@@ -0,0 +1,147 @@
+"""
+NearDuplicates.py
+
+Near-duplicate clustering of OCR blocks before they are sent to the LLM.
+
+The same advertisement is reprinted across days and newspapers with slightly
+different OCR noise, and the sliding ComposedBlock windows produce texts that
+only differ by a block or two. Exact hashing misses these, so blocks are
+compared by the Jaccard similarity of their character shingles, estimated with
+MinHash and indexed with LSH (banding) so that only blocks sharing a band are
+ever compared.
+
+Functions:
+- shingles(text, k): Set of character k-shingles of the normalized text.
+- minhash_signature(shingle_set, num_perm): MinHash signature as a uint32 array.
+- lsh_params(threshold, num_perm): Number of bands and rows per band for a Jaccard threshold.
+- cluster_signatures(signatures, threshold, lengths, previous_representatives): Clusters blocks and picks a representative per cluster.
+
+Dependencies:
+- numpy
+"""
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+SEED = 1
+
+
+def normalize_block_text(text):
+    return re.sub(r'\s+', ' ', str(text).lower()).strip()
+
+
+def shingles(text, k=5):
+    text = normalize_block_text(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+@lru_cache(maxsize=None)
+def _permutations(num_perm):
+    gen = np.random.RandomState(SEED)
+    a = gen.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = gen.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signature(shingle_set, num_perm=128):
+    """MinHash signature of a shingle set as a uint32 array of length num_perm."""
+    if not shingle_set:
+        return np.full(num_perm, MAX_HASH, dtype=np.uint32)
+    a, b = _permutations(num_perm)
+    hv = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingle_set),
+                     dtype=np.uint64, count=len(shingle_set))
+    phv = ((hv[:, None] * a + b) % MERSENNE_PRIME) & MAX_HASH
+    return phv.min(axis=0).astype(np.uint32)
+
+
+def estimated_jaccard(sig1, sig2):
+    return float(np.count_nonzero(sig1 == sig2)) / len(sig1)
+
+
+def _probability_integral(threshold, bands, rows, false_positive, steps=100):
+    if false_positive:
+        low, high = 0.0, threshold
+    else:
+        low, high = threshold, 1.0
+    width = (high - low) / steps
+    total = 0.0
+    for i in range(steps):
+        s = low + (i + 0.5) * width
+        p = 1 - (1 - s ** rows) ** bands
+        total += (p if false_positive else 1 - p) * width
+    return total
+
+
+@lru_cache(maxsize=None)
+def lsh_params(threshold, num_perm):
+    """
+    Choose the number of bands and rows per band that minimize the sum of the
+    false positive and false negative probability mass around the threshold.
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        error = (_probability_integral(threshold, bands, rows, True)
+                 + _probability_integral(threshold, bands, rows, False))
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def cluster_signatures(signatures, threshold=0.8, lengths=None, previous_representatives=()):
+    """
+    Cluster blocks whose estimated Jaccard similarity is above the threshold.
+
+    Clustering is leader based: blocks are visited with previous representatives
+    first, then longest first, and each block joins the most similar existing
+    representative or becomes one itself. Every member is therefore similar to
+    the representative that is sent to the LLM, overlapping windows cannot chain
+    into one cluster, and the result does not depend on the order of signatures.
+
+    Args:
+    signatures (dict): Maps block key to its MinHash signature.
+    threshold (float): Jaccard similarity above which blocks are clustered.
+    lengths (dict): Maps block key to its text length, used to pick representatives.
+    previous_representatives (iterable): Keys that represented a cluster in the
+        last run; they are visited first so they stay representatives and
+        their LLM results remain valid.
+
+    Returns:
+    dict: Maps every block key to the key of its cluster's representative.
+    """
+    if not signatures:
+        return {}
+    num_perm = len(next(iter(signatures.values())))
+    bands, rows = lsh_params(threshold, num_perm)
+
+    lengths = lengths or {}
+    previous_representatives = set(previous_representatives)
+    order = sorted(signatures, key=lambda key: (key not in previous_representatives,
+                                                -lengths.get(key, 0), key))
+
+    # LSH buckets hold representatives only
+    buckets = {}
+    assignment = {}
+    for key in order:
+        signature = signatures[key]
+        band_keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        candidates = set()
+        for band_key in band_keys:
+            candidates.update(buckets.get(band_key, ()))
+        best, best_similarity = None, 0.0
+        for candidate in sorted(candidates):
+            similarity = estimated_jaccard(signature, signatures[candidate])
+            if similarity >= threshold and similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is None:
+            best = key
+            for band_key in band_keys:
+                buckets.setdefault(band_key, []).append(key)
+        assignment[key] = best
+    return assignment
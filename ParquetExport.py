@@ -0,0 +1,345 @@
+"""
+ParquetExport.py
+
+Exports the SQLite tables used for analysis (newspaper_data, events,
+evaluation_results) and the normalized human dataset to Parquet, and loads
+them back with column projection and predicate pushdown.
+
+Layout (hive partitioning, one directory per table):
+    <parquet_dir>/newspaper_data/newspaper=<bib id>/year=<yyyy>/part-*.parquet
+    <parquet_dir>/events/newspaper=<bib id>/year=<yyyy>/part-*.parquet
+    <parquet_dir>/evaluation_results/year=<yyyy>/part-*.parquet
+    <parquet_dir>/human_data/year=<yyyy>/part-*.parquet
+    <parquet_dir>/_manifest.json
+
+The newspaper partition is the KB bib id that prefixes every Package ID (and
+so every custom_id), so rows keep their label whatever config['newspaper'] is
+set to. Years are parsed value by value, since the LLM writes dates in several
+formats; rows without a parseable date go to year=0.
+
+Every table is written with a fixed Arrow schema derived from the declared
+SQLite column types, so chunks that are entirely NULL in a column still share
+the schema of the other chunks.
+
+Refreshing is incremental: nothing is read if the database mtime is unchanged;
+newspaper_data is append-only, so only rows with a rowid above the last
+exported one are written; events and evaluation_results are rewritten in
+place by the other stages, so they are rewritten when a digest of their
+content changed; the human dataset is rewritten when the
+Excel file or column_mapping changed.
+
+Usage:
+    python ParquetExport.py [--config config.yaml]
+
+    from ParquetExport import read_table
+    df = read_table(config['parquet_dir'], 'newspaper_data',
+                    columns=['Date', 'ComposedBlock Content'],
+                    filters=[('newspaper', '=', 'bib4345612'), ('year', '=', 1848)])
+
+Dependencies:
+- pandas
+- pyarrow
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import yaml
+
+from EventConsolidation import parse_event_date
+
+MANIFEST_NAME = '_manifest.json'
+# Bump when the layout of the exported files changes, to rewrite all tables
+MANIFEST_VERSION = 2
+CHUNK_SIZE = 50000
+
+# Columns that are too large to be useful in analysis
+NEWSPAPER_DATA_EXCLUDED = ['Raw API Result', 'Full Prompt']
+
+# Partition columns per exported table
+PARTITIONS = {
+    'newspaper_data': ['newspaper', 'year'],
+    'events': ['newspaper', 'year'],
+    'evaluation_results': ['year'],
+    'human_data': ['year'],
+}
+
+PARTITION_TYPES = {'newspaper': pa.string(), 'year': pa.int32()}
+
+
+def load_manifest(export_dir):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+        logging.info("Parquet export has an older layout, rewriting all tables")
+        for table in PARTITIONS:
+            _clear_table(export_dir, table)
+    return {'version': MANIFEST_VERSION}
+
+
+def save_manifest(export_dir, manifest):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _year(value):
+    if value is None or pd.isna(value):
+        return 0
+    if isinstance(value, date):
+        return value.year
+    parsed = parse_event_date(value)
+    return parsed.year if parsed else 0
+
+
+def _year_column(dates):
+    return dates.map(_year).astype('int32')
+
+
+def _newspaper_column(ids):
+    return ids.str.extract(r'^(bib\d+)', expand=False).fillna('unknown')
+
+
+def _arrow_type(declared_type):
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+
+def _sqlite_schema(conn, table, columns):
+    """Arrow schema for the given columns of a table, plus its partition columns."""
+    declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info([{table}])')}
+    fields = [pa.field(col, _arrow_type(declared.get(col))) for col in columns]
+    fields += [pa.field(col, PARTITION_TYPES[col]) for col in PARTITIONS[table]]
+    return pa.schema(fields)
+
+
+def _frame_schema(df, table):
+    """Arrow schema for a DataFrame that is written in one go."""
+    fields = []
+    for col, dtype in df.dtypes.items():
+        if col in PARTITIONS[table]:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif pd.api.types.is_integer_dtype(dtype):
+            fields.append(pa.field(col, pa.int64()))
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    fields += [pa.field(col, PARTITION_TYPES[col]) for col in PARTITIONS[table]]
+    return pa.schema(fields)
+
+
+def _partitioning(table):
+    return ds.partitioning(pa.schema([pa.field(col, PARTITION_TYPES[col]) for col in PARTITIONS[table]]),
+                           flavor='hive')
+
+
+def _conform(df, schema, table):
+    """Convert the columns SQLite may return with mixed types to the schema's types."""
+    df = df.copy()
+    for field in schema:
+        if field.name in PARTITIONS[table]:
+            continue
+        column = df[field.name]
+        if pa.types.is_string(field.type):
+            df[field.name] = column.map(lambda value: None if value is None or pd.isna(value) else str(value))
+        elif pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(column, errors='coerce').astype('Int64')
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(column, errors='coerce').astype('float64')
+    return df
+
+
+def _write_partitioned(df, export_dir, table, basename, schema):
+    if df.empty:
+        return
+    pq.write_to_dataset(
+        pa.Table.from_pandas(_conform(df, schema, table), schema=schema, preserve_index=False),
+        root_path=os.path.join(export_dir, table),
+        partitioning=_partitioning(table),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+
+def _clear_table(export_dir, table):
+    shutil.rmtree(os.path.join(export_dir, table), ignore_errors=True)
+
+
+def _table_signature(conn, table):
+    try:
+        count, max_rowid = conn.execute(f'SELECT COUNT(*), MAX(rowid) FROM [{table}]').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return [count, max_rowid or 0]
+
+
+def export_newspaper_data(conn, export_dir, manifest):
+    """Append newspaper_data rows with a rowid above the last exported one."""
+    signature = _table_signature(conn, 'newspaper_data')
+    if signature is None:
+        return
+    state = manifest.get('newspaper_data', {})
+    last_rowid = state.get('max_rowid', 0)
+    # Rows were removed since the last export: start over
+    if signature[0] < state.get('count', 0) or signature[1] < last_rowid:
+        _clear_table(export_dir, 'newspaper_data')
+        last_rowid = 0
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(newspaper_data)')
+               if row[1] not in NEWSPAPER_DATA_EXCLUDED]
+    schema = _sqlite_schema(conn, 'newspaper_data', columns).insert(0, pa.field('row_id', pa.int64()))
+    select = ', '.join(f'[{col}]' for col in columns)
+    query = f'SELECT rowid AS row_id, {select} FROM newspaper_data WHERE rowid > ? ORDER BY rowid'
+
+    exported = 0
+    for chunk in pd.read_sql_query(query, conn, params=(last_rowid,), chunksize=CHUNK_SIZE):
+        chunk['newspaper'] = _newspaper_column(chunk['Package ID'].astype(str))
+        chunk['year'] = _year_column(chunk['Date'])
+        _write_partitioned(chunk, export_dir, 'newspaper_data', f"part-{chunk['row_id'].iloc[0]}", schema)
+        exported += len(chunk)
+
+    manifest['newspaper_data'] = {'count': signature[0], 'max_rowid': signature[1]}
+    logging.info(f"Exported {exported} new newspaper_data rows")
+
+
+def _table_digest(conn, table):
+    h = hashlib.sha256()
+    try:
+        for row in conn.execute(f'SELECT * FROM [{table}] ORDER BY rowid'):
+            h.update(json.dumps(row, default=str).encode('utf-8'))
+    except sqlite3.OperationalError:
+        return None
+    return h.hexdigest()
+
+
+def export_snapshot_table(conn, export_dir, manifest, table, date_column):
+    """
+    Rewrite a table that is updated in place whenever its content changed.
+
+    Row counts and rowids cannot detect this: to_sql(if_exists='replace')
+    recreates the same rowids with new values.
+    """
+    signature = _table_signature(conn, table)
+    digest = _table_digest(conn, table)
+    if digest is None or manifest.get(table, {}).get('digest') == digest:
+        return
+
+    _clear_table(export_dir, table)
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info([{table}])')]
+    schema = _sqlite_schema(conn, table, columns)
+    for i, chunk in enumerate(pd.read_sql_query(f'SELECT * FROM [{table}]', conn, chunksize=CHUNK_SIZE)):
+        if 'newspaper' in PARTITIONS[table]:
+            chunk['newspaper'] = _newspaper_column(chunk['custom_id'].astype(str))
+        chunk['year'] = _year_column(chunk[date_column])
+        _write_partitioned(chunk, export_dir, table, f"part-{i}", schema)
+
+    manifest[table] = {'digest': digest}
+    logging.info(f"Exported {signature[0]} {table} rows")
+
+
+def human_data_signature(config):
+    path = config['Stockholm_Concert_Database_Path']
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime, stat.st_size, config['column_mapping']]
+
+
+def load_human_data_cached(config, export_dir=None):
+    """
+    Return the normalized human dataset, reading the Excel file only when it
+    or column_mapping changed since the cached Parquet copy was written.
+    """
+    from AccuracyTesting import load_human_data
+
+    export_dir = export_dir or config.get('parquet_dir')
+    if not export_dir:
+        return load_human_data(config)
+
+    manifest = load_manifest(export_dir)
+    signature = json.loads(json.dumps(human_data_signature(config)))
+    if manifest.get('human_data', {}).get('signature') == signature:
+        return read_table(export_dir, 'human_data').drop(columns=['year'])
+
+    human_data = load_human_data(config)
+    _clear_table(export_dir, 'human_data')
+    cached = human_data.copy()
+    cached['year'] = _year_column(cached['normalized_date'])
+    _write_partitioned(cached, export_dir, 'human_data', 'part', _frame_schema(cached, 'human_data'))
+
+    manifest = load_manifest(export_dir)
+    manifest['human_data'] = {'signature': signature}
+    save_manifest(export_dir, manifest)
+    return human_data
+
+
+def export_all(config, export_dir=None):
+    """Incrementally refresh every exported table."""
+    export_dir = export_dir or config['parquet_dir']
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = load_manifest(export_dir)
+
+    db_mtime = os.path.getmtime(config['db_path'])
+    if manifest.get('db_mtime') != db_mtime:
+        with sqlite3.connect(config['db_path']) as conn:
+            export_newspaper_data(conn, export_dir, manifest)
+            export_snapshot_table(conn, export_dir, manifest, 'events', 'date')
+            export_snapshot_table(conn, export_dir, manifest, 'evaluation_results', 'normalized_date')
+        manifest['db_mtime'] = db_mtime
+        save_manifest(export_dir, manifest)
+    else:
+        logging.info("Database unchanged since last export")
+
+    load_human_data_cached(config, export_dir)
+
+
+def read_table(export_dir, table, columns=None, filters=None):
+    """
+    Load an exported table as a DataFrame.
+
+    Args:
+    export_dir (str): The Parquet export directory.
+    table (str): One of newspaper_data, events, evaluation_results, human_data.
+    columns (list): Columns to read; None reads all.
+    filters (list): pyarrow filters, e.g. [('year', '>=', 1848), ('newspaper', '=', 'bib4345612')].
+        Filters on partition columns skip whole directories, other filters
+        are pushed down to the row groups.
+    """
+    path = os.path.join(export_dir, table)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No Parquet export for table {table} in {export_dir}")
+    return pq.read_table(path, columns=columns, filters=filters, partitioning=_partitioning(table)).to_pandas()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the SQLite tables and human dataset to Parquet.")
+    parser.add_argument('--config', default='config.yaml', help="Path to the YAML configuration file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with open(args.config, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+    export_all(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,697 @@
+"""
+Pipeline.py
+
+Headless runner for the whole workflow that otherwise lives in the three
+notebooks. The work is modelled as a chain of stages:
+
+    download -> dedup -> cluster -> prompt -> llm -> ingest -> consolidate -> evaluate -> export
+
+Every stage fingerprints the configuration it depends on (config keys and the
+contents of files such as the prompt or JSON schema) together with each of its
+input rows. Fingerprints are kept in the stage_fingerprints table, so a run
+only recomputes the rows whose inputs changed since the last run. For example,
+editing the prompt file only re-generates prompts and re-runs the LLM for the
+affected rows, while editing column_mapping only re-runs the evaluation.
+
+Stages and their tables:
+- download: venue queries per planned date slice (see RangePlanner.py) -> newspaper_data
+- dedup: newspaper_data -> pipeline_blocks (one row per content hash)
+- cluster: pipeline_blocks -> block_minhash, block_clusters (near-duplicate
+  clusters, see NearDuplicates.py); only one representative per cluster is prompted
+- prompt: representative rows of pipeline_blocks -> pipeline_prompts
+- llm: pipeline_prompts -> completions
+- ingest: completions -> events, reasoning_steps
+- consolidate: events -> events_consolidated, events_consolidated_sources
+  (near-duplicate events merged, see EventConsolidation.py)
+- evaluate: events (or events_consolidated with evaluate_consolidated) + human
+  data -> evaluation_results (the cluster_events view propagates events from
+  representatives back to every member block)
+- export: Parquet copies of the tables in config['parquet_dir'] (see
+  ParquetExport.py, which keeps its own rowid/mtime manifest)
+
+pipeline_blocks and pipeline_prompts are keyed by content hash and kept apart
+from the notebook's newspaper_data_cleaned and LLM_Prompts tables, which the
+notebook replaces on every run.
+
+Usage:
+    python Pipeline.py [--config config.yaml] [--stages prompt llm ...] [--force] [--dry-run]
+
+A dry run opens the database read-only and only reports what would be recomputed.
+Rows an earlier stage would recompute are counted as changed in the later
+stages too (a changed prompt means a new LLM call), so the counts do not
+depend on the later stages having seen the change. They are upper bounds
+after dedup or cluster changes, since not every new block becomes a cluster
+representative, and rows a download would add are unknown until fetched.
+
+Environment variables KB_API_KEY and OPENAI_API_KEY are read from .env.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+import yaml
+
+STAGES = ['download', 'dedup', 'cluster', 'prompt', 'llm', 'ingest', 'consolidate', 'evaluate', 'export']
+
+# Config keys and file paths (config keys whose file contents matter) per stage
+STAGE_DEPENDENCIES = {
+    'download': {'keys': ['newspaper', 'composed_blocks_context'], 'files': []},
+    'dedup': {'keys': [], 'files': []},
+    'cluster': {'keys': ['near_duplicate_threshold', 'shingle_size', 'minhash_permutations'], 'files': []},
+    'prompt': {'keys': ['llm_model', 'max_tokens'], 'files': ['prompt_filepath', 'JSON_schema_path']},
+    'llm': {'keys': [], 'files': []},
+    'ingest': {'keys': [], 'files': []},
+    'consolidate': {'keys': ['event_similarity_threshold', 'event_date_window_days', 'event_shingle_size'], 'files': []},
+    'evaluate': {'keys': ['columns_to_compare', 'column_mapping', 'evaluate_consolidated'],
+                 'files': ['Stockholm_Concert_Database_Path']},
+}
+
+
+def fingerprint(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def file_digest(path):
+    if not path or not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_hash(text):
+    return hashlib.sha256(str(text).encode('utf-8')).hexdigest()
+
+
+def stage_config_fingerprint(stage, config):
+    """Fingerprint of the config keys and file contents a stage depends on."""
+    deps = STAGE_DEPENDENCIES[stage]
+    values = {key: config.get(key) for key in deps['keys']}
+    for key in deps['files']:
+        values[key] = file_digest(config.get(key))
+    return fingerprint(stage, values)
+
+
+def create_pipeline_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stage_fingerprints (
+            stage TEXT,
+            row_key TEXT,
+            fingerprint TEXT,
+            updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stage, row_key)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_blocks (
+            hash TEXT PRIMARY KEY,
+            Date TEXT,
+            [Package ID] TEXT,
+            Part INTEGER,
+            Page INTEGER,
+            [ComposedBlock Content] TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_prompts (
+            hash TEXT PRIMARY KEY,
+            custom_id TEXT UNIQUE,
+            [Full Prompt] TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS block_minhash (
+            hash TEXT PRIMARY KEY,
+            signature BLOB
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS block_clusters (
+            hash TEXT PRIMARY KEY,
+            cluster_id TEXT,
+            is_representative INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS block_clusters_cluster_id ON block_clusters (cluster_id)')
+    # Events extracted from a representative, repeated for every block in its cluster
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS cluster_events AS
+        SELECT c.hash AS block_hash, d.Date AS block_date, d.[Package ID] AS block_package_id,
+               d.Part AS block_part, d.Page AS block_page, e.*
+        FROM events e
+        JOIN pipeline_prompts p ON p.custom_id = e.custom_id
+        JOIN block_clusters c ON c.cluster_id = p.hash
+        JOIN pipeline_blocks d ON d.hash = c.hash
+    ''')
+    conn.commit()
+
+
+def _create_all_tables(conn):
+    from KBDownloader import NEWSPAPER_TABLE_SQL
+    from LLMDataProcessing import create_db_tables
+
+    conn.execute(NEWSPAPER_TABLE_SQL)
+    create_db_tables(conn)
+    create_pipeline_tables(conn)
+
+
+def _create_missing_temp_tables(conn):
+    """
+    For a read-only dry run: create empty TEMP tables for every table the
+    stages read that does not exist in the database yet.
+    """
+    template = sqlite3.connect(':memory:')
+    _create_all_tables(template)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, sql in template.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'"):
+        if name not in existing:
+            conn.execute(sql.replace('CREATE TABLE', 'CREATE TEMP TABLE', 1))
+    template.close()
+
+
+def diff_fingerprints(conn, stage, candidates, force=False):
+    """
+    Compare candidate fingerprints with the ones stored for a stage.
+
+    Args:
+    candidates (dict): Maps row key to the fingerprint of its current inputs.
+    force (bool): Treat every candidate as changed.
+
+    Returns:
+    tuple: (changed keys, removed keys) where removed keys are stored but no
+    longer among the candidates.
+    """
+    stored = dict(conn.execute(
+        'SELECT row_key, fingerprint FROM stage_fingerprints WHERE stage = ?', (stage,)))
+    changed = [key for key, fp in candidates.items() if force or stored.get(key) != fp]
+    removed = [key for key in stored if key not in candidates]
+    return changed, removed
+
+
+def record_fingerprints(conn, stage, items):
+    conn.executemany('''
+        INSERT OR REPLACE INTO stage_fingerprints (stage, row_key, fingerprint)
+        VALUES (?, ?, ?)
+    ''', [(stage, key, fp) for key, fp in items])
+    conn.commit()
+
+
+def forget_fingerprints(conn, stage, keys):
+    conn.executemany('DELETE FROM stage_fingerprints WHERE stage = ? AND row_key = ?',
+                     [(stage, key) for key in keys])
+    conn.commit()
+
+
+def _merge_upstream(changed, removed, upstream, changed_key, removed_key):
+    """In a dry run, count the keys an earlier stage would change as changed here too."""
+    if upstream is None:
+        return changed, removed
+    removed = set(removed) | set(upstream.get(removed_key, ()))
+    changed = (set(changed) | set(upstream.get(changed_key, ()))) - removed
+    return sorted(changed), sorted(removed)
+
+
+def _prompt_custom_id(key, package_id, part, page):
+    return f"{package_id}-{part}-{page}-{key[:12]}"
+
+
+def _report(stage, changed, removed, dry_run):
+    prefix = "[dry run] " if dry_run else ""
+    logging.info(f"{prefix}Stage '{stage}': {len(changed)} rows to recompute, {len(removed)} rows to remove")
+
+
+# Download stage: one work unit per planned date slice of each venue query
+def download_work_units(conn, config, collection_id, rate_controller=None, cache_only=False):
+    """
+    Planned work units for every configured year and venue query. With
+    cache_only, only cached hit counts are used (see RangePlanner.py).
+    """
+    import pandas as pd
+    from RangePlanner import plan_date_ranges
+
+    years = config.get('years_to_crawl', [])
+    if not years:
+        raise ValueError("No years specified in the configuration file.")
+    queries = pd.read_excel(config['venue_list'])['Lokal'].dropna().tolist()
+
+    for year in years:
+        for query in queries:
+            for piece in plan_date_ranges(query, collection_id, f"{year}-01-01", f"{year}-12-31",
+                                          max_hits=config.get('max_hits_per_slice', 2000), conn=conn,
+                                          rate_controller=rate_controller,
+                                          ttl_days=config.get('search_count_ttl_days', 30),
+                                          cache_only=cache_only):
+                yield dict(piece, query=query)
+
+
+def _download_key(newspaper, query, from_date, to_date):
+    return f"{newspaper}|{query}|{from_date}|{to_date}"
+
+
+def _covered(from_date, to_date, intervals):
+    """Whether [from_date, to_date] lies within the union of the ISO date intervals."""
+    day = date.fromisoformat(from_date)
+    end = date.fromisoformat(to_date)
+    for start, stop in sorted(intervals):
+        if date.fromisoformat(start) > day:
+            break
+        day = max(day, date.fromisoformat(stop) + timedelta(days=1))
+        if day > end:
+            return True
+    return day > end
+
+
+def run_download(conn, config, force=False, dry_run=False, upstream=None):
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    from KBDownloader import NEWSPAPER_COLLECTION_IDS, RateController, create_newspaper_table, fetch_newspaper_data
+
+    collection_id = NEWSPAPER_COLLECTION_IDS.get(config['newspaper'])
+    if not collection_id:
+        raise ValueError(f"Invalid newspaper name: {config['newspaper']}")
+
+    # One controller for the planner and all fetch threads, so they share one rate budget
+    rate_controller = RateController(initial_rate=config['rate_limit'])
+
+    # A dry run plans from cached hit counts only: it makes no KB requests
+    stage_fp = stage_config_fingerprint('download', config)
+    units = {}
+    for unit in download_work_units(conn, config, collection_id, rate_controller, cache_only=dry_run):
+        units[_download_key(config['newspaper'], unit['query'], unit['from_date'], unit['to_date'])] = unit
+    changed, _ = diff_fingerprints(conn, 'download', {key: stage_fp for key in units}, force)
+
+    # Slices already covered by finished work units (e.g. from an earlier plan
+    # with another hit cap) are not fetched again.
+    if not force:
+        done = {}
+        for key, fp in conn.execute("SELECT row_key, fingerprint FROM stage_fingerprints WHERE stage = 'download'"):
+            newspaper, query, from_date, to_date = key.rsplit('|', 3)
+            if fp == stage_fp:
+                done.setdefault((newspaper, query), []).append((from_date, to_date))
+        covered = {key for key in changed
+                   if _covered(units[key]['from_date'], units[key]['to_date'],
+                               done.get((config['newspaper'], units[key]['query']), []))}
+        changed = [key for key in changed if key not in covered]
+    else:
+        covered = set()
+
+    # Work units outside the configured years are kept; their rows are still valid.
+    _report('download', changed, [], dry_run)
+    if dry_run:
+        unplanned = sum(1 for key in changed if units[key]['hits'] is None)
+        if unplanned:
+            logging.info(f"[dry run] {unplanned} of these ranges have no cached hit count and are not split yet")
+        return
+
+    record_fingerprints(conn, 'download', [(key, stage_fp) for key in covered])
+
+    create_newspaper_table(config['db_path'])
+
+    def fetch(key):
+        unit = units[key]
+        return fetch_newspaper_data(
+            query=unit['query'],
+            from_date=unit['from_date'],
+            to_date=unit['to_date'],
+            newspaper=collection_id,
+            config=config,
+            db_path=config['db_path'],
+            kb_key=os.getenv('KB_API_KEY'),
+            rate_limit=config['rate_limit'],
+            num_composed_blocks=config.get('composed_blocks_context', 1),
+            rate_controller=rate_controller,
+            parse_executor=parse_executor
+        )
+
+    # ALTO parsing runs in worker processes so it neither blocks the fetchers nor is limited to one core
+    parse_workers = config.get('parse_workers', 0)
+    parse_executor = ProcessPoolExecutor(max_workers=parse_workers) if changed and parse_workers else None
+
+    pool_error = None
+    try:
+        # Workers share the rate controller, so parallelism only fills the rate budget
+        with ThreadPoolExecutor(max_workers=config.get('download_workers', 4)) as executor:
+            futures = {executor.submit(fetch, key): key for key in changed}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # Every later parse would fail too: stop starting units, they stay unrecorded
+                    if pool_error is None:
+                        pool_error = e
+                        for pending_future in futures:
+                            pending_future.cancel()
+                    logging.error(f"Download failed for {key}: parse worker pool is broken")
+                    continue
+                except Exception as e:
+                    logging.error(f"Download failed for {key}: {e}")
+                    continue
+                if result.get('success'):
+                    record_fingerprints(conn, 'download', [(key, stage_fp)])
+                else:
+                    logging.warning(f"Download failed for {key}: {result.get('message')}")
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown(cancel_futures=True)
+    if pool_error is not None:
+        raise RuntimeError("A parse worker died (e.g. out of memory); rerun the download stage "
+                           "to fetch the remaining slices") from pool_error
+
+
+# Dedup stage: keep the first row per content hash
+def run_dedup(conn, config, force=False, dry_run=False, upstream=None):
+    stage_fp = stage_config_fingerprint('dedup', config)
+    rows = {}
+    for row in conn.execute('''
+        SELECT Date, [Package ID], Part, Page, [ComposedBlock Content]
+        FROM newspaper_data ORDER BY rowid
+    '''):
+        rows.setdefault(content_hash(row[4]), row)
+
+    candidates = {key: fingerprint(stage_fp, row[:4]) for key, row in rows.items()}
+    changed, removed = diff_fingerprints(conn, 'dedup', candidates, force)
+    _report('dedup', changed, removed, dry_run)
+    if dry_run:
+        if upstream is not None:
+            upstream['blocks'] = {key: rows[key][1:4] for key in changed}
+            upstream['removed_blocks'] = removed
+        return
+
+    conn.executemany('DELETE FROM pipeline_blocks WHERE hash = ?', [(key,) for key in removed])
+    conn.executemany('''
+        INSERT OR REPLACE INTO pipeline_blocks
+        (hash, Date, [Package ID], Part, Page, [ComposedBlock Content])
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(key,) + tuple(rows[key]) for key in changed])
+    conn.commit()
+    forget_fingerprints(conn, 'dedup', removed)
+    record_fingerprints(conn, 'dedup', [(key, candidates[key]) for key in changed])
+
+
+# Cluster stage: MinHash signatures for new rows, LSH clustering over all rows
+def run_cluster(conn, config, force=False, dry_run=False, upstream=None):
+    import numpy as np
+    from NearDuplicates import cluster_signatures, minhash_signature, shingles
+
+    shingle_size = config.get('shingle_size', 5)
+    num_perm = config.get('minhash_permutations', 128)
+
+    stage_fp = stage_config_fingerprint('cluster', config)
+    lengths = dict(conn.execute('SELECT hash, LENGTH([ComposedBlock Content]) FROM pipeline_blocks'))
+    candidates = {key: stage_fp for key in lengths}
+    changed, removed = diff_fingerprints(conn, 'cluster', candidates, force)
+    changed, removed = _merge_upstream(changed, removed, upstream, 'blocks', 'removed_blocks')
+    _report('cluster', changed, removed, dry_run)
+    if dry_run:
+        if upstream is not None:
+            blocks = upstream.get('blocks', {})
+            pending = set(changed) - set(blocks)
+            for key, package_id, part, page in conn.execute('SELECT hash, [Package ID], Part, Page FROM pipeline_blocks'):
+                if key in pending:
+                    blocks[key] = (package_id, part, page)
+            upstream['blocks'] = {key: blocks[key] for key in changed if key in blocks}
+            upstream['removed_blocks'] = removed
+        return
+    if not (changed or removed):
+        return
+
+    pending = set(changed)
+    signatures = []
+    for key, content in conn.execute('SELECT hash, [ComposedBlock Content] FROM pipeline_blocks'):
+        if key in pending:
+            signature = minhash_signature(shingles(content, shingle_size), num_perm)
+            signatures.append((key, signature.tobytes()))
+    conn.executemany('DELETE FROM block_minhash WHERE hash = ?', [(key,) for key in removed])
+    conn.executemany('INSERT OR REPLACE INTO block_minhash (hash, signature) VALUES (?, ?)', signatures)
+
+    all_signatures = {key: np.frombuffer(blob, dtype=np.uint32)
+                      for key, blob in conn.execute('SELECT hash, signature FROM block_minhash')}
+    previous = [row[0] for row in conn.execute('SELECT hash FROM block_clusters WHERE is_representative = 1')]
+    assignment = cluster_signatures(all_signatures, config.get('near_duplicate_threshold', 0.8),
+                                    lengths, previous)
+
+    conn.execute('DELETE FROM block_clusters')
+    conn.executemany('INSERT INTO block_clusters (hash, cluster_id, is_representative) VALUES (?, ?, ?)',
+                     [(key, cluster_id, int(key == cluster_id)) for key, cluster_id in assignment.items()])
+    conn.commit()
+    forget_fingerprints(conn, 'cluster', removed)
+    record_fingerprints(conn, 'cluster', [(key, stage_fp) for key in changed])
+    logging.info(f"Clustered {len(assignment)} blocks into {len(set(assignment.values()))} clusters")
+
+
+# Prompt stage: one full prompt per cluster representative
+def run_prompt(conn, config, force=False, dry_run=False, upstream=None):
+    from LLMDataProcessing import build_full_prompt
+
+    stage_fp = stage_config_fingerprint('prompt', config)
+    # Rows that were never clustered count as their own representative
+    rows = {row[0]: row for row in conn.execute('''
+        SELECT d.hash, d.Date, d.[Package ID], d.Part, d.Page, d.[ComposedBlock Content]
+        FROM pipeline_blocks d
+        LEFT JOIN block_clusters c ON c.hash = d.hash
+        WHERE c.hash IS NULL OR c.is_representative = 1
+    ''')}
+    # The content is represented by the hash key itself
+    candidates = {key: fingerprint(stage_fp, row[:5]) for key, row in rows.items()}
+    changed, removed = diff_fingerprints(conn, 'prompt', candidates, force)
+    changed, removed = _merge_upstream(changed, removed, upstream, 'blocks', 'removed_blocks')
+    _report('prompt', changed, removed, dry_run)
+    if dry_run:
+        if upstream is not None:
+            blocks = upstream.get('blocks', {})
+            upstream['custom_ids'] = [_prompt_custom_id(key, *(rows[key][2:5] if key in rows else blocks[key]))
+                                      for key in changed]
+            pending = set(removed)
+            upstream['removed_custom_ids'] = [custom_id for key, custom_id
+                                              in conn.execute('SELECT hash, custom_id FROM pipeline_prompts')
+                                              if key in pending]
+        return
+
+    with open(config['prompt_filepath'], 'r') as file:
+        system_message_content = file.read().strip()
+    with open(config['JSON_schema_path'], 'r') as file:
+        json_schema = json.load(file)
+
+    prompts = []
+    for key in changed:
+        _, date, package_id, part, page, content = rows[key]
+        custom_id = _prompt_custom_id(key, package_id, part, page)
+        prompts.append((key, custom_id,
+                        build_full_prompt(custom_id, date, content, config, system_message_content, json_schema)))
+
+    conn.executemany('DELETE FROM pipeline_prompts WHERE hash = ?', [(key,) for key in removed])
+    conn.executemany('INSERT OR REPLACE INTO pipeline_prompts (hash, custom_id, [Full Prompt]) VALUES (?, ?, ?)', prompts)
+    conn.commit()
+    forget_fingerprints(conn, 'prompt', removed)
+    record_fingerprints(conn, 'prompt', [(key, candidates[key]) for key in changed])
+
+
+# LLM stage: one completion per prompt
+def run_llm(conn, config, force=False, dry_run=False, client=None, upstream=None):
+    from tqdm import tqdm
+    from LLMDataProcessing import request_completion, store_completion
+
+    stage_fp = stage_config_fingerprint('llm', config)
+    prompts = dict(conn.execute('SELECT custom_id, [Full Prompt] FROM pipeline_prompts'))
+    candidates = {key: fingerprint(stage_fp, prompt) for key, prompt in prompts.items()}
+    changed, removed = diff_fingerprints(conn, 'llm', candidates, force)
+    changed, removed = _merge_upstream(changed, removed, upstream, 'custom_ids', 'removed_custom_ids')
+    _report('llm', changed, removed, dry_run)
+    if dry_run:
+        if upstream is not None:
+            upstream['custom_ids'] = changed
+            upstream['removed_custom_ids'] = removed
+        return
+
+    conn.executemany('DELETE FROM completions WHERE custom_id = ?', [(key,) for key in removed])
+    conn.commit()
+    forget_fingerprints(conn, 'llm', removed)
+
+    if changed and client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+    for custom_id in tqdm(changed, desc="Processing prompts"):
+        try:
+            content = request_completion(client, prompts[custom_id])
+        except Exception as e:
+            # Leave the fingerprint untouched so the row is retried next run
+            logging.error(f"Error processing prompt {custom_id}: {e}")
+            continue
+        store_completion(conn, custom_id, content)
+        record_fingerprints(conn, 'llm', [(custom_id, candidates[custom_id])])
+
+
+def _delete_events(conn, custom_ids):
+    conn.executemany('DELETE FROM events WHERE custom_id = ?', [(key,) for key in custom_ids])
+    conn.executemany('DELETE FROM reasoning_steps WHERE custom_id = ?', [(key,) for key in custom_ids])
+    conn.commit()
+
+
+# Ingest stage: parse completions into events
+def run_ingest(conn, config, force=False, dry_run=False, upstream=None):
+    from LLMDataProcessing import extract_and_store_event_data
+
+    stage_fp = stage_config_fingerprint('ingest', config)
+    completions = dict(conn.execute('SELECT custom_id, content FROM completions'))
+    candidates = {key: fingerprint(stage_fp, content) for key, content in completions.items()}
+    changed, removed = diff_fingerprints(conn, 'ingest', candidates, force)
+    changed, removed = _merge_upstream(changed, removed, upstream, 'custom_ids', 'removed_custom_ids')
+    _report('ingest', changed, removed, dry_run)
+    if dry_run:
+        if upstream is not None:
+            upstream['events'] = bool(changed or removed)
+        return
+
+    _delete_events(conn, removed + changed)
+    forget_fingerprints(conn, 'ingest', removed)
+    cursor = conn.cursor()
+    for custom_id in changed:
+        extract_and_store_event_data(cursor, custom_id, completions[custom_id])
+    record_fingerprints(conn, 'ingest', [(key, candidates[key]) for key in changed])
+
+
+def events_digest(conn, table='events', order_by='custom_id'):
+    h = hashlib.sha256()
+    for row in conn.execute(f'SELECT * FROM {table} ORDER BY {order_by}'):
+        h.update(json.dumps(row, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+# Consolidate stage: rebuilt as a whole when events or its settings change
+def run_consolidate(conn, config, force=False, dry_run=False, upstream=None):
+    from EventConsolidation import consolidate_events
+
+    stage_fp = stage_config_fingerprint('consolidate', config)
+    candidates = {'events_consolidated': fingerprint(stage_fp, events_digest(conn))}
+    changed, _ = diff_fingerprints(conn, 'consolidate', candidates, force)
+    if upstream is not None and upstream.get('events'):
+        changed = list(candidates)
+    _report('consolidate', changed, [], dry_run)
+    if dry_run:
+        if upstream is not None:
+            upstream['consolidated'] = bool(changed)
+        return
+    if not changed:
+        return
+
+    consolidate_events(conn, config)
+    record_fingerprints(conn, 'consolidate', candidates.items())
+
+
+# Evaluate stage: the whole table is one unit, recomputed when events or settings change
+def run_evaluate(conn, config, force=False, dry_run=False, upstream=None):
+    from AccuracyTesting import load_llm_events, save_evaluation_results, score_human_against_llm
+    from ParquetExport import load_human_data_cached
+
+    stage_fp = stage_config_fingerprint('evaluate', config)
+    if config.get('evaluate_consolidated', False):
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'events_consolidated'").fetchone():
+            logging.warning("Stage 'evaluate': events_consolidated does not exist, run the consolidate stage first")
+            return
+        digest = events_digest(conn, 'events_consolidated', 'event_id')
+    else:
+        digest = events_digest(conn)
+    candidates = {'evaluation_results': fingerprint(stage_fp, digest)}
+    changed, _ = diff_fingerprints(conn, 'evaluate', candidates, force)
+    source = 'consolidated' if config.get('evaluate_consolidated', False) else 'events'
+    if upstream is not None and upstream.get(source):
+        changed = list(candidates)
+    _report('evaluate', changed, [], dry_run)
+    if dry_run or not changed:
+        return
+
+    llm_data = load_llm_events(conn, config)
+    human_data = load_human_data_cached(config)
+    results = score_human_against_llm(human_data, llm_data, config['columns_to_compare'])
+    save_evaluation_results(conn, results)
+    record_fingerprints(conn, 'evaluate', candidates.items())
+
+
+# Export stage: incremental by itself, only runs when parquet_dir is configured
+def run_export(conn, config, force=False, dry_run=False, upstream=None):
+    from ParquetExport import export_all
+
+    if not config.get('parquet_dir'):
+        logging.info("Stage 'export': no parquet_dir configured, skipping")
+        return
+    if dry_run:
+        return
+    if force:
+        shutil.rmtree(config['parquet_dir'], ignore_errors=True)
+    conn.commit()
+    export_all(config)
+
+
+STAGE_RUNNERS = {
+    'download': run_download,
+    'dedup': run_dedup,
+    'cluster': run_cluster,
+    'prompt': run_prompt,
+    'llm': run_llm,
+    'ingest': run_ingest,
+    'consolidate': run_consolidate,
+    'evaluate': run_evaluate,
+    'export': run_export,
+}
+
+
+def run_pipeline(config, stages=STAGES, force=False, dry_run=False):
+    """Run the selected stages in pipeline order against config['db_path']."""
+    if dry_run:
+        # Read-only, so a dry run can never change the database
+        uri = Path(config['db_path']).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True)
+        _create_missing_temp_tables(conn)
+    else:
+        conn = sqlite3.connect(config['db_path'])
+        _create_all_tables(conn)
+    # Keys each stage would change, passed on to the later stages of a dry run
+    upstream = {} if dry_run else None
+    try:
+        for stage in STAGES:
+            if stage in stages:
+                logging.info(f"Running stage '{stage}'")
+                STAGE_RUNNERS[stage](conn, config, force=force, dry_run=dry_run, upstream=upstream)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the download -> LLM -> evaluation pipeline incrementally.")
+    parser.add_argument('--config', default='config.yaml', help="Path to the YAML configuration file")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to run (in pipeline order)")
+    parser.add_argument('--force', action='store_true', help="Recompute every row of the selected stages")
+    parser.add_argument('--dry-run', action='store_true', help="Only report how many rows each stage would recompute")
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.config, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    run_pipeline(config, stages=args.stages, force=args.force, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
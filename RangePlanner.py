@@ -0,0 +1,140 @@
+"""
+RangePlanner.py
+
+Plans the date slices a venue query is crawled in.
+
+Instead of two fixed half-year windows per year, the planner asks KB for the
+hit count of a range first and bisects the range until every slice is under a
+hit cap. Neighbouring sparse slices are then merged back together while their
+combined hits stay under the cap, so every slice is a similarly sized work
+unit that can be fetched in parallel and resumed on its own.
+
+Hit counts are cached in the search_hit_counts table for ttl_days, so
+re-planning the same query does not repeat the count requests while KB's
+collection for that range is unlikely to have grown. With cache_only the
+planner never contacts KB or writes the cache; ranges without a cached count
+are returned unsplit with hits=None.
+
+Functions:
+- count_search_hits(from_date, to_date, collection_id, query, conn, ...): Number of hits for a range.
+- plan_date_ranges(query, collection_id, from_date, to_date, max_hits, conn, ...): Balanced slices for a query.
+"""
+import logging
+import sqlite3
+from datetime import date, timedelta
+
+from KBDownloader import search_swedish_newspapers
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _create_count_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_hit_counts (
+            collection_id TEXT,
+            query TEXT,
+            from_date TEXT,
+            to_date TEXT,
+            hits INTEGER,
+            checked DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (collection_id, query, from_date, to_date)
+        )
+    ''')
+
+
+def _cached_hits(conn, key, ttl_days):
+    age_limit = f'-{ttl_days} days' if ttl_days is not None else None
+    try:
+        row = conn.execute('''
+            SELECT hits FROM search_hit_counts
+            WHERE collection_id = ? AND query = ? AND from_date = ? AND to_date = ?
+              AND (? IS NULL OR checked >= datetime('now', ?))
+        ''', key + (age_limit, age_limit)).fetchone()
+    except sqlite3.OperationalError:
+        # No cache table yet
+        return None
+    return row[0] if row else None
+
+
+def count_search_hits(from_date, to_date, collection_id, query, conn=None, rate_controller=None,
+                      ttl_days=None, cache_only=False):
+    """
+    Number of search hits for a date range.
+
+    Requests a single hit and reads the total from the response; if KB does
+    not report a total, the full result is fetched and counted.
+
+    Args:
+    ttl_days (int): Cached counts older than this are requested again; None keeps them forever.
+    cache_only (bool): Only read the cache; returns None if the count is not cached.
+    """
+    key = (collection_id, query, str(from_date), str(to_date))
+    if conn is not None:
+        hits = _cached_hits(conn, key, ttl_days)
+        if hits is not None or cache_only:
+            return hits
+    elif cache_only:
+        return None
+
+    result = search_swedish_newspapers(str(to_date), str(from_date), collection_id, query,
+                                       rate_controller=rate_controller, limit=1)
+    hits = result.get('total')
+    if hits is None:
+        result = search_swedish_newspapers(str(to_date), str(from_date), collection_id, query,
+                                           rate_controller=rate_controller)
+        hits = len(result.get('hits', []))
+
+    if conn is not None:
+        _create_count_table(conn)
+        conn.execute('''
+            INSERT OR REPLACE INTO search_hit_counts (collection_id, query, from_date, to_date, hits)
+            VALUES (?, ?, ?, ?, ?)
+        ''', key + (hits,))
+        conn.commit()
+    return hits
+
+
+def _bisect(query, collection_id, from_date, to_date, max_hits, conn, rate_controller, ttl_days, cache_only):
+    hits = count_search_hits(from_date, to_date, collection_id, query, conn, rate_controller, ttl_days, cache_only)
+    if hits is None or hits <= max_hits or from_date == to_date:
+        if hits is not None and hits > max_hits:
+            logging.warning(f"{hits} hits for '{query}' on {from_date} alone exceed the cap of {max_hits}")
+        return [{'from_date': from_date, 'to_date': to_date, 'hits': hits}]
+
+    middle = from_date + (to_date - from_date) // 2
+    return (_bisect(query, collection_id, from_date, middle, max_hits, conn, rate_controller, ttl_days, cache_only)
+            + _bisect(query, collection_id, middle + timedelta(days=1), to_date, max_hits, conn, rate_controller,
+                      ttl_days, cache_only))
+
+
+def merge_sparse_slices(slices, max_hits):
+    """Merge adjacent slices while their combined hits stay under max_hits."""
+    merged = []
+    for piece in slices:
+        if (merged
+                and merged[-1]['hits'] is not None and piece['hits'] is not None
+                and merged[-1]['to_date'] + timedelta(days=1) == piece['from_date']
+                and merged[-1]['hits'] + piece['hits'] <= max_hits):
+            merged[-1] = {'from_date': merged[-1]['from_date'], 'to_date': piece['to_date'],
+                          'hits': merged[-1]['hits'] + piece['hits']}
+        else:
+            merged.append(dict(piece))
+    return merged
+
+
+def plan_date_ranges(query, collection_id, from_date, to_date, max_hits=2000, conn=None, rate_controller=None,
+                     ttl_days=None, cache_only=False):
+    """
+    Split [from_date, to_date] into slices with at most max_hits hits each.
+
+    Returns:
+    list: Dicts with from_date and to_date (YYYY-MM-DD) and the hit count
+    (None for unplanned ranges when cache_only). Slices without hits are dropped.
+    """
+    slices = _bisect(query, collection_id, _as_date(from_date), _as_date(to_date), max_hits, conn, rate_controller,
+                     ttl_days, cache_only)
+    return [{'from_date': piece['from_date'].isoformat(), 'to_date': piece['to_date'].isoformat(),
+             'hits': piece['hits']}
+            for piece in merge_sparse_slices(slices, max_hits) if piece['hits'] is None or piece['hits'] > 0]